@@ -12,25 +12,29 @@ Dependencies:
     - tenacity (Retry Logic)
 """
 
+import argparse
 import csv
 import sys
+import threading
 from dataclasses import dataclass, fields, asdict
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import httpx
 import pandas as pd
 from parsel import Selector
-from tenacity import retry, stop_after_attempt, wait_fixed
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_fixed
 
 # --- Import from your new Utils Package ---
 # Ensure your project root is in PYTHONPATH or run as module
 try:
-    from src.utils import setup_logger, clean_text
+    from src.utils import setup_logger, clean_text, ShardCoordinator, run_sharded, merge_parts, part_path
+    from src.utils.http_errors import is_transient_error
 except ImportError:
     # Fallback for running script directly without package context (Not recommended but helpful for debugging)
     sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
-    from src.utils import setup_logger, clean_text
+    from src.utils import setup_logger, clean_text, ShardCoordinator, run_sharded, merge_parts, part_path
+    from src.utils.http_errors import is_transient_error
 
 # Initialize Professional Logger
 logger = setup_logger(__name__)
@@ -90,9 +94,9 @@ class IMDbMetadataExtractor:
         value = item.css('span.ipc-metadata-list-item__list-content-item::text').get()
         return clean_text(value)
 
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+    @retry(stop=stop_after_attempt(3), wait=wait_fixed(2), retry=retry_if_exception(is_transient_error))
     def fetch_page(self, url: str) -> Optional[Selector]:
-        """Fetches the URL with automatic retries."""
+        """Fetches the URL with automatic retries (transient errors only; a 404 is final)."""
         if 'imdb.com/title/' not in url:
             logger.warning(f"Skipping invalid URL format: {url}")
             return None
@@ -141,21 +145,47 @@ class IMDbMetadataExtractor:
         
         return data
 
-    def run_pipeline(self, input_path: Path, output_path: Path):
+    @staticmethod
+    def load_urls(input_path: Path) -> Optional[pd.Series]:
         """
-        Executes the main scraping pipeline with Idempotency (Resume capability).
+        Loads the 'URL' column of the input Excel. Missing values are kept so
+        that positions match the input rows (shard ranges rely on this).
         """
         if not input_path.exists():
             logger.critical(f"Input file not found: {input_path}")
-            return
+            return None
 
-        # 1. Load Tasks
         df = pd.read_excel(input_path)
         if 'URL' not in df.columns:
             logger.critical("Input Excel is missing the required 'URL' column.")
-            return
+            return None
+
+        return df['URL']
+
+    def run_pipeline(self, input_path: Path, output_path: Path, urls: Optional[List[str]] = None,
+                     lease_lost: Optional[threading.Event] = None) -> int:
+        """
+        Executes the main scraping pipeline with Idempotency (Resume capability).
+
+        Args:
+            input_path: Excel file with a 'URL' column.
+            output_path: CSV checkpoint to append results to.
+            urls: Pre-loaded URLs to process instead of reading input_path (used by sharded runs).
+            lease_lost: Set by the shard coordinator once another worker took over; stops the loop.
+
+        Returns:
+            int: Number of URLs that failed transiently (network errors, 5xx, 429)
+            and will be retried on the next run. Permanent failures such as a 404
+            are logged and skipped, like invalid URLs.
+        """
+        # 1. Load Tasks
+        if urls is None:
+            url_column = self.load_urls(input_path)
+            if url_column is None:
+                return 0
+            urls = url_column.dropna().tolist()
         
-        urls = df['URL'].dropna().tolist()
+        failed = 0
         
         # 2. Idempotency Check (Load existing progress)
         processed_urls = set()
@@ -185,6 +215,10 @@ class IMDbMetadataExtractor:
                 if url in processed_urls:
                     continue
                 
+                if lease_lost is not None and lease_lost.is_set():
+                    logger.warning(f"\nLease lost; stopping before {url} to avoid racing the new owner.")
+                    return failed
+                
                 # Simple progress indicator to console (using \r to update line)
                 sys.stdout.write(f"\r[Processing] {i+1}/{total_tasks} | {url[:50]}...")
                 sys.stdout.flush()
@@ -193,12 +227,19 @@ class IMDbMetadataExtractor:
                     selector = self.fetch_page(url)
                     if selector:
                         movie_data = self.parse(url, selector)
+                        if lease_lost is not None and lease_lost.is_set():
+                            return failed
                         writer.writerow(asdict(movie_data))
                         f.flush() # Ensure data is written to disk immediately
                 except Exception as e:
-                    logger.error(f"\nFailed to process {url}: {e}")
+                    if is_transient_error(e):
+                        failed += 1
+                        logger.error(f"\nFailed to process {url}: {e}")
+                    else:
+                        logger.warning(f"\nSkipping {url} after a permanent error: {e}")
 
-        logger.info(f"\nPipeline complete. Data saved to {output_path}")
+        logger.info(f"\nPipeline complete. Data saved to {output_path} ({failed} failed)")
+        return failed
 
 if __name__ == "__main__":
     # --- Configuration for Execution ---
@@ -209,8 +250,46 @@ if __name__ == "__main__":
     INPUT_FILE = PROJECT_ROOT / "data" / "raw" / "urls" / "IMDB_Movie_URLs.xlsx"
     OUTPUT_FILE = PROJECT_ROOT / "data" / "raw" / "metadata" / "IMDb_Movie_Details.csv"
 
+    parser = argparse.ArgumentParser(description="Extract IMDb movie metadata.")
+    parser.add_argument('--sharded', action='store_true',
+                        help="Claim index ranges via the shared shard database (run on every node).")
+    parser.add_argument('--merge', action='store_true',
+                        help="Compact the per-shard output parts into the final CSV.")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Return shards that exhausted their attempts to the pending pool first.")
+    args = parser.parse_args()
+
     # Ensure output directory exists
     OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
 
     scraper = IMDbMetadataExtractor()
-    scraper.run_pipeline(INPUT_FILE, OUTPUT_FILE)
\ No newline at end of file
+
+    if args.sharded or args.merge:
+        from src.utils.config_loader import config
+        shard_cfg = config['sharding']
+        coordinator = ShardCoordinator(PROJECT_ROOT / shard_cfg['db_path'], job='metadata',
+                                       lease_seconds=shard_cfg['lease_seconds'],
+                                       max_attempts=shard_cfg['max_attempts'],
+                                       retry_backoff=shard_cfg['retry_backoff'])
+        if args.retry_failed:
+            coordinator.reset_failed()
+        if args.sharded:
+            # Load the input once per worker; each shard only slices it
+            url_column = scraper.load_urls(INPUT_FILE)
+            if url_column is None:
+                sys.exit(1)
+            coordinator.plan(len(url_column), shard_cfg['shard_size'])
+
+            def process_shard(shard, lease_lost):
+                shard_urls = url_column.iloc[shard.start:shard.stop].dropna().tolist()
+                failed = scraper.run_pipeline(INPUT_FILE, part_path(OUTPUT_FILE, shard),
+                                              urls=shard_urls, lease_lost=lease_lost)
+                if failed:
+                    # Raising releases the shard for a retry instead of marking it done
+                    raise RuntimeError(f"{failed} URL(s) failed in [{shard.start}, {shard.stop})")
+
+            run_sharded(coordinator, process_shard, poll_interval=shard_cfg['poll_interval'])
+        if args.merge:
+            merge_parts(coordinator, OUTPUT_FILE, dedupe_on=['url'])
+    else:
+        scraper.run_pipeline(INPUT_FILE, OUTPUT_FILE)
\ No newline at end of file
@@ -3,18 +3,35 @@ IMDb Reviews Scraper
 Description: Iterates through movies and fetches paginated user reviews via AJAX.
 """
 
+import argparse
+import csv
 import logging
+import sys
+import threading
 import time
 import re
-from typing import Dict, List, Optional
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 import pandas as pd
 import httpx
 from bs4 import BeautifulSoup
 from tenacity import retry, wait_fixed, stop_after_attempt
 
+try:
+    from src.utils import ShardCoordinator, run_sharded, merge_parts, part_path
+    from src.utils.http_errors import is_transient_error
+except ImportError:
+    sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+    from src.utils import ShardCoordinator, run_sharded, merge_parts, part_path
+    from src.utils.http_errors import is_transient_error
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Output columns: movie metadata inherited by every review, then the review itself
+REVIEW_FIELDS = ['Movie Title', 'IMDb URL', 'Director',
+                 'review_title', 'author', 'date', 'content', 'user_rating']
+
 class IMDbReviewFetcher:
     def __init__(self, output_file: str):
         self.output_file = output_file
@@ -70,51 +87,149 @@ class IMDbReviewFetcher:
         
         return reviews, next_key
 
-    def process_dataset(self, input_csv: str):
-        df = pd.read_csv(input_csv)
-        all_reviews = []
-        
-        for idx, row in df.iterrows():
-            movie_meta = {
-                'Movie Title': row.get('title'),
-                'IMDb URL': row.get('url'),
-                'Director': row.get('director')
-            }
-            reviews_url = row.get('reviews_url')
-            
-            if pd.isna(reviews_url) or "http" not in reviews_url:
-                continue
+    def process_dataset(self, input_csv: str, output_file: Optional[str] = None,
+                        movies: Optional[pd.DataFrame] = None,
+                        lease_lost: Optional[threading.Event] = None) -> int:
+        """
+        Scrapes reviews for the movies of the input and appends them to
+        output_file (defaults to self.output_file) as each movie finishes.
+        Movies already present in output_file are skipped, so a rerun only
+        fetches what is missing.
 
+        Sharded runs pass a pre-loaded slice as `movies` and the coordinator's
+        `lease_lost` event; once it is set, nothing more is written so the
+        worker that took over owns the output. Returns the number of movies
+        that failed transiently (permanent errors such as a 404 are skipped).
+        """
+        output_file = Path(output_file or self.output_file)
+        df = pd.read_csv(input_csv) if movies is None else movies
+        failed = 0
+        saved = 0
+
+        # Idempotency Check: movies with at least one saved review are done.
+        # Movies without reviews leave no trace and are simply fetched again.
+        processed_urls = set()
+        if output_file.exists():
             try:
-                # Extract ID like 'tt1234567'
-                imdb_id = reviews_url.split('/title/')[1].split('/')[0]
-            except IndexError:
-                continue
-            
-            logger.info(f"Fetching reviews for: {movie_meta['Movie Title']}")
-            
-            # Logic flow for pagination would go here
-            # Due to the complexity of the AJAX key generation without the JS file,
-            # this section focuses on the structure:
-            
-            # 1. Initial Request (to get first batch or tokens)
-            # 2. Loop with paginationKey
-            # 3. Append to all_reviews
-            
-            # For demonstration, we assume we fetch just the main page reviews 
-            # to avoid the broken JS dependency in this refactor example.
-            try:
-                res = self.session.get(reviews_url, headers=self.headers)
-                reviews, _ = self.parse_reviews(res.text, movie_meta)
-                all_reviews.extend(reviews)
+                existing_df = pd.read_csv(output_file, usecols=['IMDb URL'], encoding='utf-8-sig')
+                processed_urls = set(existing_df['IMDb URL'].dropna().tolist())
+                logger.info(f"Resume Check: Found reviews for {len(processed_urls)} movies in {output_file}")
             except Exception as e:
-                logger.error(f"Failed to scrape {reviews_url}: {e}")
+                logger.warning(f"Could not read existing checkpoint: {e}. Starting fresh.")
+
+        write_header = not output_file.exists()
+
+        with open(output_file, 'a', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=REVIEW_FIELDS)
+            if write_header:
+                writer.writeheader()
+
+            for idx, row in df.iterrows():
+                if lease_lost is not None and lease_lost.is_set():
+                    logger.warning(f"Lease lost; stopping before writing more to {output_file}")
+                    return failed
+
+                if row.get('url') in processed_urls:
+                    continue
+
+                failed_movie, reviews = self._fetch_movie_reviews(row)
+                failed += failed_movie
+                if reviews and not (lease_lost is not None and lease_lost.is_set()):
+                    writer.writerows(reviews)
+                    f.flush() # Ensure data is written to disk immediately
+                    saved += len(reviews)
+
+        logger.info(f"Saved {saved} new reviews to {output_file} ({failed} movies failed)")
+        return failed
 
-        # Save Final
-        final_df = pd.DataFrame(all_reviews)
-        final_df.to_csv(self.output_file, index=False, encoding='utf-8-sig')
-        logger.info(f"Saved {len(final_df)} reviews to {self.output_file}")
+    def _fetch_movie_reviews(self, row: pd.Series) -> Tuple[int, List[Dict]]:
+        """
+        Fetches the reviews of a single movie.
+
+        Returns:
+            Tuple[int, List[Dict]]: 1 if the movie failed transiently (else 0), and its reviews.
+        """
+        movie_meta = {
+            'Movie Title': row.get('title'),
+            'IMDb URL': row.get('url'),
+            'Director': row.get('director')
+        }
+        reviews_url = row.get('reviews_url')
+        
+        if pd.isna(reviews_url) or "http" not in reviews_url:
+            return 0, []
+
+        try:
+            # Extract ID like 'tt1234567'
+            imdb_id = reviews_url.split('/title/')[1].split('/')[0]
+        except IndexError:
+            return 0, []
+        
+        logger.info(f"Fetching reviews for: {movie_meta['Movie Title']}")
+        
+        # Logic flow for pagination would go here
+        # Due to the complexity of the AJAX key generation without the JS file,
+        # this section focuses on the structure:
+        
+        # 1. Initial Request (to get first batch or tokens)
+        # 2. Loop with paginationKey
+        # 3. Append to reviews
+        
+        # For demonstration, we assume we fetch just the main page reviews 
+        # to avoid the broken JS dependency in this refactor example.
+        try:
+            res = self.session.get(reviews_url, headers=self.headers)
+            res.raise_for_status()
+            reviews, _ = self.parse_reviews(res.text, movie_meta)
+            return 0, reviews
+        except Exception as e:
+            if is_transient_error(e):
+                logger.error(f"Failed to scrape {reviews_url}: {e}")
+                return 1, []
+            logger.warning(f"Skipping {reviews_url} after a permanent error: {e}")
+            return 0, []
 
 if __name__ == "__main__":
-    fetcher = IMDbReviewFetcher(output_file="./data/IMDb_Reviews_Final.csv")
-    fetcher.process_dataset("./data/IMDb_Movie_Details_Clean.csv")
+    parser = argparse.ArgumentParser(description="Collect IMDb user reviews.")
+    parser.add_argument('--sharded', action='store_true',
+                        help="Claim index ranges via the shared shard database (run on every node).")
+    parser.add_argument('--merge', action='store_true',
+                        help="Compact the per-shard output parts into the final CSV.")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Return shards that exhausted their attempts to the pending pool first.")
+    args = parser.parse_args()
+
+    # Resolve against the project root so every node reads and writes the same files
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+    INPUT_FILE = PROJECT_ROOT / "data" / "IMDb_Movie_Details_Clean.csv"
+    OUTPUT_FILE = PROJECT_ROOT / "data" / "IMDb_Reviews_Final.csv"
+    fetcher = IMDbReviewFetcher(output_file=str(OUTPUT_FILE))
+
+    if args.sharded or args.merge:
+        from src.utils.config_loader import config
+        shard_cfg = config['sharding']
+        coordinator = ShardCoordinator(PROJECT_ROOT / shard_cfg['db_path'], job='reviews',
+                                       lease_seconds=shard_cfg['lease_seconds'],
+                                       max_attempts=shard_cfg['max_attempts'],
+                                       retry_backoff=shard_cfg['retry_backoff'])
+        if args.retry_failed:
+            coordinator.reset_failed()
+        if args.sharded:
+            # Load the input once per worker; each shard only slices it
+            movies = pd.read_csv(INPUT_FILE)
+            coordinator.plan(len(movies), shard_cfg['shard_size'])
+
+            def process_shard(shard, lease_lost):
+                failed = fetcher.process_dataset(str(INPUT_FILE), output_file=str(part_path(OUTPUT_FILE, shard)),
+                                                 movies=movies.iloc[shard.start:shard.stop], lease_lost=lease_lost)
+                if failed:
+                    # Raising releases the shard for a retry instead of marking it done
+                    raise RuntimeError(f"{failed} movie(s) failed in [{shard.start}, {shard.stop})")
+
+            run_sharded(coordinator, process_shard, poll_interval=shard_cfg['poll_interval'])
+        if args.merge:
+            # No dedupe: a takeover resumes the part instead of rewriting rows, and
+            # reviews lack a unique key (empty author/title would collapse together)
+            merge_parts(coordinator, OUTPUT_FILE)
+    else:
+        fetcher.process_dataset(str(INPUT_FILE))
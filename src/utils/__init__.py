@@ -2,10 +2,14 @@
 Utilities Module
 ~~~~~~~~~~~~~~~~
 Provides shared functionality for logging, text preprocessing, 
-and configuration management across the acquisition and analysis pipelines.
+configuration management, and multi-node shard coordination across the acquisition and analysis pipelines.
 """
 
 from .logger import setup_logger
 from .text_cleaner import clean_text, normalize_whitespace
+from .sharding import ShardCoordinator, Shard, run_sharded, merge_parts, part_path
 
-__all__ = ['setup_logger', 'clean_text', 'normalize_whitespace']
\ No newline at end of file
+__all__ = [
+    'setup_logger', 'clean_text', 'normalize_whitespace',
+    'ShardCoordinator', 'Shard', 'run_sharded', 'merge_parts', 'part_path',
+]
\ No newline at end of file
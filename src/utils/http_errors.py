@@ -0,0 +1,35 @@
+"""
+HTTP Error Classification
+~~~~~~~~~~~~~~~~~~~~~~~~~
+Separates transient network failures, which are worth retrying later, from
+permanent ones (e.g. a 404 on a dead IMDb link), which are logged and skipped.
+"""
+
+import httpx
+from tenacity import RetryError
+
+# Status codes that usually clear up on their own (rate limiting, server faults)
+TRANSIENT_STATUS_CODES = {408, 425, 429}
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    Returns True if the failure is worth retrying on a later run.
+
+    Args:
+        exc (BaseException): The raised exception. A tenacity ``RetryError``
+            is unwrapped to the exception of its last attempt.
+
+    Returns:
+        bool: True for network errors, HTTP 5xx and rate-limit style 4xx;
+        False for other 4xx and for errors outside the HTTP layer.
+    """
+    if isinstance(exc, RetryError):
+        exc = exc.last_attempt.exception()
+
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status >= 500 or status in TRANSIENT_STATUS_CODES
+
+    # Connection resets, timeouts, DNS failures, ...
+    return isinstance(exc, httpx.TransportError)
\ No newline at end of file
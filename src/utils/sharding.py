@@ -0,0 +1,442 @@
+"""
+Shard Coordination Utility
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+Splits a pipeline input into contiguous index ranges ("shards") and lets
+several worker nodes claim them through time-limited leases stored in a
+shared SQLite file.
+
+Each worker renews its lease with a background heartbeat while it processes
+a shard. If a node crashes or stalls, its lease expires and any idle worker
+takes the shard over automatically. A shard that keeps failing is retried
+with exponential backoff and marked as failed after ``max_attempts``. Every
+shard writes to its own output part (e.g.
+``movie_reviews_analysis_100000_101000.xlsx``), and ``merge_parts`` compacts
+the parts into the final dataset once all shards are complete.
+
+Notes:
+    - Lease expiry relies on wall-clock time, so node clocks should be
+      NTP-synchronised and ``lease_seconds`` kept well above any skew.
+    - SQLite locking over NFS/SMB is only as reliable as the file system's
+      advisory locks; prefer a local disk or a share with proper lock support.
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Union
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Shard lifecycle states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    job           TEXT    NOT NULL,
+    shard_id      INTEGER NOT NULL,
+    start         INTEGER NOT NULL,
+    stop          INTEGER NOT NULL,
+    status        TEXT    NOT NULL DEFAULT 'pending',
+    owner         TEXT,
+    lease_expires REAL    NOT NULL DEFAULT 0,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    available_at  REAL    NOT NULL DEFAULT 0,
+    PRIMARY KEY (job, shard_id)
+)
+"""
+
+
+def default_worker_id() -> str:
+    """Returns an identifier that is unique per process across nodes."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass
+class Shard:
+    """A contiguous, half-open index range [start, stop) of a pipeline input."""
+    job: str
+    shard_id: int
+    start: int
+    stop: int
+    status: str = PENDING
+    owner: Optional[str] = None
+    lease_expires: float = 0.0
+    attempts: int = 0
+    available_at: float = 0.0
+
+
+class ShardCoordinator:
+    """
+    Lease-based work claiming backed by a shared SQLite database.
+
+    Args:
+        db_path (Union[str, Path]): Location of the shared SQLite file.
+        job (str): Name of the pipeline stage (e.g. 'metadata', 'reviews').
+            Several jobs can share one database file.
+        lease_seconds (float): How long a claim stays valid without a heartbeat.
+        max_attempts (int): Claims per shard before it is marked as failed.
+        retry_backoff (float): Base delay in seconds before a failed shard may
+            be claimed again; doubles with every attempt.
+    """
+
+    def __init__(self, db_path: Union[str, Path], job: str, lease_seconds: float = 300.0,
+                 max_attempts: int = 3, retry_backoff: float = 60.0):
+        self.db_path = Path(db_path)
+        self.job = job
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Opens a short-lived connection in autocommit mode (one per call, thread-safe)."""
+        conn = sqlite3.connect(str(self.db_path), timeout=60.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs a write transaction holding the database lock from the first statement."""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def plan(self, total: int, shard_size: int) -> List[Shard]:
+        """
+        Registers the shards for an input of ``total`` rows. Idempotent, so
+        every node may call it on start-up.
+
+        Raises:
+            ValueError: If the job was already planned with different boundaries.
+        """
+        if shard_size <= 0:
+            raise ValueError(f"shard_size must be positive, got {shard_size}")
+
+        bounds = [(i, start, min(start + shard_size, total))
+                  for i, start in enumerate(range(0, total, shard_size))]
+
+        with self._transaction() as conn:
+            existing = conn.execute(
+                'SELECT shard_id, start, stop FROM shards WHERE job = ? ORDER BY shard_id',
+                (self.job,)
+            ).fetchall()
+
+            if existing:
+                if [tuple(row) for row in existing] != bounds:
+                    raise ValueError(
+                        f"Job '{self.job}' is already planned with different shard boundaries "
+                        f"in {self.db_path}. Use a new job name or database file."
+                    )
+            else:
+                conn.executemany(
+                    'INSERT INTO shards (job, shard_id, start, stop) VALUES (?, ?, ?, ?)',
+                    [(self.job, *b) for b in bounds]
+                )
+                logger.info(f"Planned {len(bounds)} shards of size {shard_size} for job '{self.job}'.")
+
+        return self.shards()
+
+    def shards(self, status: Optional[str] = None) -> List[Shard]:
+        """Returns the shards of the job (optionally only those in ``status``), in input order."""
+        query, params = 'SELECT * FROM shards WHERE job = ?', [self.job]
+        if status is not None:
+            query, params = query + ' AND status = ?', params + [status]
+
+        with self._connect() as conn:
+            rows = conn.execute(query + ' ORDER BY shard_id', params).fetchall()
+        return [Shard(**dict(row)) for row in rows]
+
+    def claim(self, worker_id: str) -> Optional[Shard]:
+        """
+        Claims the next available pending shard, or takes over a running shard
+        whose lease has expired. Shards with the fewest attempts go first, so a
+        shard that keeps failing cannot starve the others. Returns None if
+        nothing is currently claimable.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            # A shard whose owners keep dying mid-way (e.g. out of memory) is given up
+            # on the same way as one that keeps raising.
+            conn.execute(
+                """
+                UPDATE shards SET status = ?, owner = NULL
+                WHERE job = ? AND status = ? AND lease_expires < ? AND attempts >= ?
+                """,
+                (FAILED, self.job, RUNNING, now, self.max_attempts)
+            )
+
+            row = conn.execute(
+                """
+                SELECT * FROM shards
+                WHERE job = ?
+                  AND ((status = ? AND available_at <= ?) OR (status = ? AND lease_expires < ?))
+                ORDER BY attempts, shard_id
+                LIMIT 1
+                """,
+                (self.job, PENDING, now, RUNNING, now)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            if row['status'] == RUNNING:
+                logger.warning(
+                    f"Taking over stalled shard {row['shard_id']} [{row['start']}, {row['stop']}) "
+                    f"from {row['owner']}."
+                )
+
+            expires = now + self.lease_seconds
+            conn.execute(
+                """
+                UPDATE shards
+                SET status = ?, owner = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE job = ? AND shard_id = ?
+                """,
+                (RUNNING, worker_id, expires, self.job, row['shard_id'])
+            )
+
+        shard = Shard(**dict(row))
+        shard.status, shard.owner, shard.lease_expires = RUNNING, worker_id, expires
+        shard.attempts += 1
+        return shard
+
+    def heartbeat(self, shard: Shard, worker_id: str) -> bool:
+        """Extends the lease. Returns False if the shard was lost to another worker."""
+        return self._update_owned(
+            shard, worker_id, 'lease_expires = ?', (time.time() + self.lease_seconds,)
+        )
+
+    def complete(self, shard: Shard, worker_id: str) -> bool:
+        """Marks the shard as done. Returns False if the shard was lost to another worker."""
+        return self._update_owned(shard, worker_id, 'status = ?', (DONE,))
+
+    def fail(self, shard: Shard, worker_id: str) -> bool:
+        """
+        Records a failed attempt. The shard returns to the pending pool after an
+        exponential backoff, or is marked as failed once ``max_attempts`` is reached.
+        Returns False if the shard was lost to another worker.
+        """
+        if shard.attempts >= self.max_attempts:
+            logger.error(
+                f"Shard {shard.shard_id} [{shard.start}, {shard.stop}) failed {shard.attempts} times; giving up."
+            )
+            return self._update_owned(shard, worker_id, 'status = ?, owner = NULL', (FAILED,))
+
+        available_at = time.time() + self.retry_backoff * 2 ** (shard.attempts - 1)
+        return self._update_owned(
+            shard, worker_id, 'status = ?, owner = NULL, lease_expires = 0, available_at = ?',
+            (PENDING, available_at)
+        )
+
+    def reset_failed(self) -> int:
+        """Returns failed shards to the pending pool with a fresh attempt budget."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE shards SET status = ?, attempts = 0, available_at = 0
+                WHERE job = ? AND status = ?
+                """,
+                (PENDING, self.job, FAILED)
+            )
+        return cursor.rowcount
+
+    def _update_owned(self, shard: Shard, worker_id: str, assignment: str, params: tuple) -> bool:
+        """Applies an update only while ``worker_id`` still holds the lease."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"""
+                UPDATE shards SET {assignment}
+                WHERE job = ? AND shard_id = ? AND owner = ? AND status = ?
+                """,
+                (*params, self.job, shard.shard_id, worker_id, RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def is_finished(self) -> bool:
+        """
+        Returns True once no shard is pending or running. Check ``shards(FAILED)``
+        to tell a clean finish from one with shards that were given up on.
+        """
+        with self._connect() as conn:
+            remaining = conn.execute(
+                'SELECT COUNT(*) FROM shards WHERE job = ? AND status IN (?, ?)',
+                (self.job, PENDING, RUNNING)
+            ).fetchone()[0]
+        return remaining == 0
+
+    @contextmanager
+    def hold(self, shard: Shard, worker_id: str, interval: Optional[float] = None) -> Iterator[threading.Event]:
+        """
+        Keeps the lease alive from a background thread while the body runs.
+
+        Yields:
+            threading.Event: Set if the lease was lost. Work must check it before
+            writing output and stop, so it does not race the worker that took over.
+        """
+        interval = interval or self.lease_seconds / 3
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def _beat():
+            while not stop.wait(interval):
+                try:
+                    if not self.heartbeat(shard, worker_id):
+                        logger.error(f"Lease on shard {shard.shard_id} was lost to another worker.")
+                        lost.set()
+                        return
+                except sqlite3.Error as e:
+                    # Transient lock contention; the next beat will retry
+                    logger.warning(f"Heartbeat for shard {shard.shard_id} failed: {e}")
+
+        thread = threading.Thread(target=_beat, name=f"heartbeat-{shard.shard_id}", daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+
+def part_path(output_path: Union[str, Path], shard: Shard) -> Path:
+    """
+    Derives the output part of a shard from the final output path,
+    e.g. 'reviews.csv' -> 'reviews_100000_101000.csv'.
+    """
+    output_path = Path(output_path)
+    return output_path.with_name(f"{output_path.stem}_{shard.start}_{shard.stop}{output_path.suffix}")
+
+
+def run_sharded(coordinator: ShardCoordinator, process: Callable[[Shard, threading.Event], None],
+                worker_id: Optional[str] = None, poll_interval: float = 30.0) -> int:
+    """
+    Worker loop: claims shards and processes them until the whole job is done.
+
+    When no shard is claimable but others are still leased or backing off, the
+    worker idles and polls, so it can take over any shard whose owner stops
+    heartbeating.
+
+    Args:
+        coordinator (ShardCoordinator): The shared coordinator for this job.
+        process (Callable[[Shard, threading.Event], None]): Processes
+            ``[shard.start, shard.stop)`` into the shard's own output part. It
+            must raise on failure and return early once the event (lease lost)
+            is set.
+        worker_id (Optional[str]): Unique worker name; defaults to host-pid.
+        poll_interval (float): Seconds to wait between claim attempts while idle.
+
+    Returns:
+        int: Number of shards completed by this worker.
+    """
+    worker_id = worker_id or default_worker_id()
+    completed = 0
+
+    while True:
+        shard = coordinator.claim(worker_id)
+        if shard is None:
+            if coordinator.is_finished():
+                break
+            time.sleep(poll_interval)
+            continue
+
+        logger.info(f"[{worker_id}] Processing shard {shard.shard_id} [{shard.start}, {shard.stop}) "
+                    f"(attempt {shard.attempts}/{coordinator.max_attempts}).")
+        try:
+            with coordinator.hold(shard, worker_id) as lost:
+                process(shard, lost)
+        except Exception as e:
+            logger.error(f"[{worker_id}] Shard {shard.shard_id} failed: {e}")
+            coordinator.fail(shard, worker_id)
+            continue
+
+        if lost.is_set():
+            logger.warning(f"[{worker_id}] Abandoned shard {shard.shard_id} after its lease was lost.")
+        elif coordinator.complete(shard, worker_id):
+            completed += 1
+        else:
+            logger.warning(f"[{worker_id}] Shard {shard.shard_id} finished after its lease was lost.")
+
+    failed = coordinator.shards(FAILED)
+    if failed:
+        logger.error(f"[{worker_id}] {len(failed)} shard(s) failed permanently: "
+                     f"{[(s.start, s.stop) for s in failed]}")
+    logger.info(f"[{worker_id}] No shards left. Completed {completed} shard(s).")
+    return completed
+
+
+def merge_parts(coordinator: ShardCoordinator, output_path: Union[str, Path],
+                dedupe_on: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Compacts the per-shard output parts into ``output_path`` in input order.
+
+    Args:
+        coordinator (ShardCoordinator): The coordinator whose shards produced the parts.
+        output_path (Union[str, Path]): Final output (.csv or .xlsx).
+        dedupe_on (Optional[List[str]]): Key columns used to drop rows written
+            twice when a shard was taken over mid-way.
+
+    Returns:
+        pd.DataFrame: The merged dataset.
+
+    Raises:
+        RuntimeError: If any shard is unfinished or failed.
+        FileNotFoundError: If a completed shard has no output part. Every
+            completed shard must write one, even if it has no rows.
+    """
+    if not coordinator.is_finished():
+        raise RuntimeError(f"Job '{coordinator.job}' still has unfinished shards; refusing to merge.")
+
+    failed = coordinator.shards(FAILED)
+    if failed:
+        raise RuntimeError(
+            f"Job '{coordinator.job}' has {len(failed)} failed shard(s) "
+            f"{[(s.start, s.stop) for s in failed]}; re-run them before merging."
+        )
+
+    output_path = Path(output_path)
+    frames = []
+    for shard in coordinator.shards():
+        path = part_path(output_path, shard)
+        if not path.exists():
+            raise FileNotFoundError(f"Missing output part for completed shard {shard.shard_id}: {path}")
+        if path.suffix == '.xlsx':
+            frames.append(pd.read_excel(path))
+        else:
+            try:
+                frames.append(pd.read_csv(path, encoding='utf-8-sig'))
+            except pd.errors.EmptyDataError:
+                logger.info(f"Output part for shard {shard.shard_id} has no rows: {path}")
+
+    merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if dedupe_on and not merged.empty:
+        merged = merged.drop_duplicates(subset=dedupe_on, keep='last')
+
+    if output_path.suffix == '.xlsx':
+        merged.to_excel(output_path, index=False)
+    else:
+        merged.to_csv(output_path, index=False, encoding='utf-8-sig')
+
+    logger.info(f"Merged {len(frames)} parts ({len(merged)} rows) into {output_path}")
+    return merged
\ No newline at end of file
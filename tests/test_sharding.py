@@ -0,0 +1,158 @@
+"""Tests for the lease-based shard coordinator (src/utils/sharding.py)."""
+
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from src.utils.sharding import (
+    DONE, FAILED, PENDING, ShardCoordinator, merge_parts, part_path, run_sharded,
+)
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    coord = ShardCoordinator(tmp_path / "shards.sqlite", job="test",
+                             lease_seconds=0.3, max_attempts=2, retry_backoff=0.0)
+    coord.plan(25, 10)
+    return coord
+
+
+def _write_part(output_path, shard, lease_lost=None):
+    pd.DataFrame({'i': range(shard.start, shard.stop)}).to_csv(part_path(output_path, shard), index=False)
+
+
+def test_plan_is_idempotent_and_rejects_different_boundaries(coordinator):
+    shards = coordinator.plan(25, 10)
+    assert [(s.start, s.stop) for s in shards] == [(0, 10), (10, 20), (20, 25)]
+
+    with pytest.raises(ValueError):
+        coordinator.plan(25, 5)
+
+
+def test_expired_lease_is_taken_over(coordinator):
+    stalled = coordinator.claim("dead-node")
+    # Finish the remaining shards so only the stalled one is left
+    for _ in range(2):
+        shard = coordinator.claim("busy")
+        coordinator.complete(shard, "busy")
+    assert coordinator.claim("idle") is None
+
+    time.sleep(0.4)
+    taken = coordinator.claim("idle")
+
+    assert taken.shard_id == stalled.shard_id
+    assert taken.owner == "idle" and taken.attempts == 2
+    # The stalled owner can no longer heartbeat or complete the shard
+    assert not coordinator.heartbeat(stalled, "dead-node")
+    assert not coordinator.complete(stalled, "dead-node")
+    assert coordinator.complete(taken, "idle")
+
+
+def test_heartbeat_keeps_lease(coordinator):
+    shard = coordinator.claim("a")
+    with coordinator.hold(shard, "a", interval=0.05) as lost:
+        time.sleep(0.5)
+        assert coordinator.claim("b").shard_id != shard.shard_id
+        assert not lost.is_set()
+    assert coordinator.complete(shard, "a")
+
+
+def test_failing_shard_is_given_up_without_starving_others(coordinator, tmp_path):
+    output = tmp_path / "out.csv"
+
+    def process(shard, lease_lost):
+        if shard.shard_id == 0:
+            raise ValueError("bad row")
+        _write_part(output, shard)
+
+    completed = run_sharded(coordinator, process, worker_id="w", poll_interval=0.01)
+
+    assert completed == 2
+    statuses = {s.shard_id: (s.status, s.attempts) for s in coordinator.shards()}
+    assert statuses == {0: (FAILED, 2), 1: (DONE, 1), 2: (DONE, 1)}
+    assert coordinator.is_finished()
+
+    with pytest.raises(RuntimeError, match="failed shard"):
+        merge_parts(coordinator, output)
+
+    assert coordinator.reset_failed() == 1
+    assert coordinator.shards(PENDING)[0].attempts == 0
+
+
+def test_failed_shard_backs_off_before_retry(tmp_path):
+    coord = ShardCoordinator(tmp_path / "shards.sqlite", job="test",
+                             lease_seconds=10, max_attempts=3, retry_backoff=0.3)
+    coord.plan(10, 10)
+    shard = coord.claim("w")
+    coord.fail(shard, "w")
+
+    assert coord.claim("w") is None
+    time.sleep(0.35)
+    assert coord.claim("w").shard_id == shard.shard_id
+
+
+def test_stalled_shard_is_completed_by_another_worker(coordinator, tmp_path, monkeypatch):
+    output = tmp_path / "out.csv"
+    other = ShardCoordinator(coordinator.db_path, job="test",
+                             lease_seconds=0.3, max_attempts=2, retry_backoff=0.0)
+
+    # Worker "a" stalls: its heartbeats stop reaching the database until it wakes up
+    stalled = threading.Event()
+    stalled.set()
+    real_heartbeat = coordinator.heartbeat
+    monkeypatch.setattr(coordinator, 'heartbeat',
+                        lambda shard, worker_id: True if stalled.is_set() else real_heartbeat(shard, worker_id))
+    noticed_loss = []
+
+    def stuck(shard, lease_lost):
+        time.sleep(0.4)  # Lease expires while "a" is stuck
+        run_sharded(other, lambda s, lost: _write_part(output, s), worker_id="b", poll_interval=0.01)
+        stalled.clear()
+        noticed_loss.append(lease_lost.wait(1.0))  # The next real heartbeat sees the takeover
+
+    completed = run_sharded(coordinator, stuck, worker_id="a", poll_interval=0.01)
+
+    assert completed == 0 and noticed_loss == [True]
+    shards = coordinator.shards()
+    assert all(s.status == DONE and s.owner == "b" for s in shards)
+    assert shards[0].attempts == 2
+    assert len(merge_parts(coordinator, output)) == 25
+
+
+def test_merge_parts_orders_and_dedupes(coordinator, tmp_path):
+    output = tmp_path / "out.csv"
+    for shard in reversed(coordinator.shards()):
+        claimed = coordinator.claim("w")
+        _write_part(output, claimed)
+        coordinator.complete(claimed, "w")
+    # A takeover re-wrote row 10 into the last part
+    last = part_path(output, coordinator.shards()[-1])
+    pd.concat([pd.read_csv(last), pd.DataFrame({'i': [10]})]).to_csv(last, index=False)
+
+    merged = merge_parts(coordinator, output, dedupe_on=['i'])
+
+    assert sorted(merged['i']) == list(range(25))
+    assert pd.read_csv(output, encoding='utf-8-sig')['i'].tolist() == merged['i'].tolist()
+
+
+def test_merge_parts_rejects_missing_part_but_accepts_empty(coordinator, tmp_path):
+    output = tmp_path / "out.csv"
+    while (shard := coordinator.claim("w")) is not None:
+        _write_part(output, shard)
+        coordinator.complete(shard, "w")
+
+    empty = part_path(output, coordinator.shards()[1])
+    pd.DataFrame([]).to_csv(empty, index=False)
+    assert len(merge_parts(coordinator, output)) == 15
+
+    empty.unlink()
+    with pytest.raises(FileNotFoundError):
+        merge_parts(coordinator, output)
+
+
+def test_merge_refuses_unfinished_job(coordinator, tmp_path):
+    coordinator.claim("w")
+    with pytest.raises(RuntimeError, match="unfinished"):
+        merge_parts(coordinator, tmp_path / "out.csv")